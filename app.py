@@ -1,13 +1,83 @@
 import streamlit as st
 import requests
-import uuid
+import secrets
+import json
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 
 # Base URLs for communicating with FastAPI backend endpoints
-API_URL = "http://127.0.0.1:8000/chat"
+STREAM_URL = "http://127.0.0.1:8000/chat/stream"
 HISTORY_URL = "http://127.0.0.1:8000/history"
 RESET_URL = "http://127.0.0.1:8000/reset-history"
 
+# Entries requested per history page (the backend's maximum page size)
+HISTORY_PAGE_LIMIT = 1000
+
+# (connect, read) timeouts for backend calls; the read timeout covers LLM latency
+REQUEST_TIMEOUT = (3, 30)
+
+# Shared HTTP session kept across Streamlit reruns so keep-alive connections are reused
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=3)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Fetch stored history for a session and convert it to (role, message) display tuples
+@st.cache_data(ttl=60)
+def load_history(session_id: str) -> list[tuple[str, str]]:
+    # Page backwards with next_before until the oldest entry has been fetched
+    history = []
+    params = {"limit": HISTORY_PAGE_LIMIT}
+    while True:
+        r = get_http_session().get(
+            f"{HISTORY_URL}/{session_id}",
+            params=params,
+            timeout=REQUEST_TIMEOUT,
+        ).json()
+
+        history = r["history"] + history
+        if r.get("next_before") is None:
+            break
+        params["before"] = r["next_before"]
+
+    messages = []
+    for item in history:
+        timestamp = item.get("timestamp", "")
+        tool = item.get("tool_used", "no_tool")
+
+        # Extract only time from ISO timestamp
+        time_str = timestamp.split("T")[1][:8] if timestamp else ""
+
+        messages.append(("user", f"🕒 {time_str} — {item['user']}"))
+        messages.append(
+            ("assistant", f"🛠 Tool: `{tool}`\n\n🕒 {time_str} — {item['assistant']}")
+        )
+
+    return messages
+
+# Stream reply tokens from the backend; the final event's fields are stored in `result`
+def stream_reply(session_id: str, message: str, result: dict):
+    with get_http_session().post(
+        STREAM_URL,
+        json={"session_id": session_id, "message": message},
+        stream=True,
+        timeout=REQUEST_TIMEOUT,
+    ) as r:
+        r.raise_for_status()
+
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+
+            event = json.loads(line[len("data: "):])
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "end":
+                result.update(event)
+
 # Configure Streamlit page settings
 st.set_page_config(
     page_title="AI Agent Chat",
@@ -20,7 +90,7 @@ st.caption("FastAPI + MongoDB + Tool Detection Enabled")
 
 # Session ID initialization for tracking conversation state
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())[:8]
+    st.session_state.session_id = secrets.token_hex(4)
 
 # Local chat history to display messages persistently on the UI
 if "chat_history" not in st.session_state:
@@ -39,17 +109,22 @@ st.sidebar.code(st.session_state.session_id)
 
 # Button to start a fresh session (new session ID + clear local history)
 if st.sidebar.button("New Session"):
-    st.session_state.session_id = str(uuid.uuid4())[:8]
+    st.session_state.session_id = secrets.token_hex(4)
     st.session_state.chat_history = []
     st.session_state.loaded = False
+    load_history.clear()
     st.rerun()
 
 # Button to clear backend MongoDB-stored conversation history
 if st.sidebar.button("Reset Mongo History"):
     try:
-        requests.delete(f"{RESET_URL}/{st.session_state.session_id}")
+        get_http_session().delete(
+            f"{RESET_URL}/{st.session_state.session_id}",
+            timeout=REQUEST_TIMEOUT,
+        )
         st.session_state.chat_history = []
         st.session_state.loaded = False
+        load_history.clear()
         st.success("✅ Session history cleared from MongoDB")
         st.rerun()
     except:
@@ -58,26 +133,7 @@ if st.sidebar.button("Reset Mongo History"):
 # Load previous messages from backend (only once per session load)
 if not st.session_state.loaded:
     try:
-        r = requests.get(f"{HISTORY_URL}/{st.session_state.session_id}").json()
-
-        # Loop through stored history and convert to display format
-        for item in r["history"]:
-            timestamp = item.get("timestamp", "")
-            tool = item.get("tool_used", "no_tool")
-
-            # Extract only time from ISO timestamp
-            time_str = timestamp.split("T")[1][:8] if timestamp else ""
-
-            # Append user message to internal state
-            st.session_state.chat_history.append(
-                ("user", f"🕒 {time_str} — {item['user']}")
-            )
-
-            # Append assistant message along with detected tool
-            st.session_state.chat_history.append(
-                ("assistant", f"🛠 Tool: `{tool}`\n\n🕒 {time_str} — {item['assistant']}")
-            )
-
+        st.session_state.chat_history = load_history(st.session_state.session_id)
         st.session_state.loaded = True
 
     except Exception as e:
@@ -104,30 +160,30 @@ if user_input:
     with st.chat_message("user"):
         st.markdown(f"🕒 {timestamp} — {user_input}")
 
-    try:
-        # Send request to FastAPI backend for response
-        r = requests.post(
-            API_URL,
-            json={
-                "session_id": st.session_state.session_id,
-                "message": user_input
-            }
-        ).json()
+    # Display assistant message in chat UI, streaming tokens as they arrive
+    with st.chat_message("assistant"):
+        header = st.empty()
+        header.markdown(f"🕒 {timestamp}")
+        result = {}
 
-        # Extract assistant reply and tool used
-        reply = r.get("response", "")
-        tool_used = r.get("route_selected", "no_tool")
+        try:
+            reply = st.write_stream(
+                stream_reply(st.session_state.session_id, user_input, result)
+            )
 
-    except Exception as e:
-        # Handle failure to contact backend
-        reply = f"❌ Backend error: {e}"
-        tool_used = "error"
+            # Extract assistant reply and tool used
+            reply = result.get("response", reply)
+            tool_used = result.get("route_selected", "no_tool")
+
+        except Exception as e:
+            # Handle failure to contact backend
+            reply = f"❌ Backend error: {e}"
+            tool_used = "error"
+            st.markdown(reply)
+
+        header.markdown(f"🛠 Tool: `{tool_used}`\n\n🕒 {timestamp}")
 
     # Store assistant reply in history
     st.session_state.chat_history.append(
         ("assistant", f"🛠 Tool: `{tool_used}`\n\n🕒 {timestamp} — {reply}")
     )
-
-    # Display assistant message in chat UI
-    with st.chat_message("assistant"):
-        st.markdown(f"🛠 Tool: `{tool_used}`\n\n🕒 {timestamp} — {reply}")
@@ -1,9 +1,32 @@
 import os
-from datetime import datetime
-from fastapi import FastAPI
-from pydantic import BaseModel
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from bisect import bisect_right
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import TYPE_CHECKING, NamedTuple
+import anyio.to_thread
+import httpx
+from fastapi import BackgroundTasks, FastAPI, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from cachetools import LRUCache, TTLCache
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+import tiktoken
+
+# LangChain is imported lazily in get_agent(); these are only needed for type hints
+if TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from langchain.memory import ConversationSummaryBufferMemory
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,6 +35,19 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MONGO_URI = os.getenv("MONGO_URI")
 
+# Maximum number of agent runs allowed to call OpenAI at the same time
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+
+# Uvicorn worker processes for `python main.py`. Session memory and the response cache
+# live in each process and requests are not sticky, so more than one worker splits a
+# session's context across processes; keep the default of 1 unless that is acceptable
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Agent calls retried on rate limits; kept small so retries finish well within the
+# frontend's 30 s read timeout (the OpenAI client's own retries are disabled)
+AGENT_RETRY_ATTEMPTS = 3
+AGENT_RETRY_MAX_WAIT = 4
+
 # Ensure required environment variables exist
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY not found in .env")
@@ -19,79 +55,269 @@ if not OPENAI_API_KEY:
 if not MONGO_URI:
     raise ValueError("MONGO_URI not found in .env")
 
-# Connect to MongoDB using provided URI
-client = MongoClient(MONGO_URI)
-db = client["agent_db"]
+# Conversations are stored with short field names to shrink documents on disk and on the wire:
+# sid = session_id, u = user, a = assistant, t = tool_used, ts = timestamp (epoch ns)
+
+# Index used for per-session history lookups ordered by time
+HISTORY_INDEX = [("sid", 1), ("ts", 1)]
+
+# Long-key index and marker id for the one-off migration of pre-short-key documents
+LEGACY_HISTORY_INDEX = "session_id_1_timestamp_1"
+SHORT_KEYS_MIGRATION_ID = "conversations_short_keys"
+
+# Pipeline update renaming long keys to short ones; BSON dates (oldest rows) become epoch ns
+SHORT_KEYS_MIGRATION = [
+    {
+        "$set": {
+            "sid": "$session_id",
+            "u": "$user",
+            "a": "$assistant",
+            "t": "$tool_used",
+            "ts": {
+                "$cond": [
+                    {"$eq": [{"$type": "$timestamp"}, "date"]},
+                    {"$multiply": [{"$toLong": "$timestamp"}, 1_000_000]},
+                    "$timestamp",
+                ]
+            },
+        }
+    },
+    {"$unset": ["session_id", "user", "assistant", "tool_used", "timestamp"]},
+]
+
+# Default and maximum number of history entries returned per page
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_ENTRIES = 1000
 
-# Collection to store chat conversations
-conversation_collection = db["conversations"]
+# Documents fetched per cursor round-trip when reading history
+HISTORY_BATCH_SIZE = 200
 
-# LangChain imports used for LLM, tools, memory, agent, prompts
-from langchain_openai import ChatOpenAI
-from langchain_core.tools import tool
-from langchain.memory import ConversationBufferMemory
-from langchain.agents import create_openai_functions_agent, AgentExecutor
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+# Fields returned to the frontend for each history entry
+HISTORY_PROJECTION = {"_id": 0, "u": 1, "a": 1, "t": 1, "ts": 1}
 
-# FastAPI application initialization
-app = FastAPI(title="AI Agent Backend (Auto Tool Selection)")
+# Conversation writes are queued and flushed in batches of up to this many entries
+WRITE_BATCH_SIZE = 100
+
+# Maximum time (seconds) a queued conversation entry waits before being flushed
+WRITE_FLUSH_INTERVAL = 0.05
+
+# Worker threads available to sync handlers and threadpool offloads (anyio default is 40)
+THREADPOOL_SIZE = 200
+
+# Token budget for recent turns kept verbatim; older turns are folded into a running summary
+MEMORY_MAX_TOKENS = 800
+
+# Hard cap on tokens of memory (summary + recent messages) sent with each agent call
+MEMORY_INPUT_TOKEN_LIMIT = 3000
+
+# Maximum number of session memories kept in process (least recently used are evicted)
+SESSION_MEMORY_LIMIT = 10_000
+
+# Tag marking the memory summarizer's LLM runs so their tokens are not streamed to clients
+SUMMARY_LLM_TAG = "memory_summary"
+
+# Number of recent memory messages folded into the response cache key
+CACHE_CONTEXT_MESSAGES = 4
+
+# Mock student marks database (read-only, built once at import)
+STUDENT_MARKS_DB = MappingProxyType({
+    "Priya": MappingProxyType({"English": 92, "Maths": 88, "Science": 95}),
+    "Amit": MappingProxyType({"English": 78, "Maths": 81, "Science": 74}),
+    "Rahul": MappingProxyType({"English": 67, "Maths": 72, "Science": 70}),
+})
+
+# Lowercase -> canonical lookups for student names and subjects detected in user text
+STUDENT_NAMES = MappingProxyType({name.lower(): name for name in STUDENT_MARKS_DB})
+SUBJECTS = MappingProxyType({"english": "English", "maths": "Maths", "science": "Science"})
+
+# Grade boundaries: marks below 70 -> C, 70+ -> B, 80+ -> A, 90+ -> A+
+GRADE_THRESHOLDS = (70, 80, 90)
+GRADES = ("C", "B", "A", "A+")
+
+# Precompiled patterns for detecting student names and subjects in marks queries
+STUDENT_NAME_RE = re.compile(r"\b(" + "|".join(sorted(STUDENT_NAMES)) + r")\b", re.IGNORECASE)
+SUBJECT_RE = re.compile(r"\b(" + "|".join(sorted(SUBJECTS)) + r")\b", re.IGNORECASE)
 
-# Create the ChatOpenAI model instance with deterministic behavior
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0,
-    api_key=OPENAI_API_KEY,
+# Patterns that deterministically route a message to a tool without calling the LLM
+SUICIDE_RE = re.compile(r"\b(suicid\w*|kill myself|self[- ]harm|end my life)\b", re.IGNORECASE)
+# Only a clear negative-prompt request is routed: an imperative ("write a negative prompt
+# for X") or a leading "negative prompt: X". Questions about negative prompts and bare
+# avoid/exclude wording (e.g. "avoid hurting myself") go to the agent and its safety rules.
+# The subject X is what the tool rewrites.
+NEGATIVE_RE = re.compile(
+    r"^\s*(?:"
+    r"(?:please\s+)?(?:give|write|make|create|generate)\s+(?:me\s+)?(?:an?\s+)?"
+    r"negative prompt\s+(?:for|of|about|on)\s+"
+    r"|negative prompt\s*:\s*"
+    r")(?P<subject>\w.*?)[\s.!]*$",
+    re.IGNORECASE | re.DOTALL,
+)
+MARKS_RE = re.compile(r"\b(marks?|grades?|scores?|scored)\b", re.IGNORECASE)
+
+# A marks lookup must be phrased as a question or request, not a statement about marks
+QUESTION_RE = re.compile(
+    r"\?\s*$|^\s*(what|how|which|show|tell|give|get|check|list|find|did|does|can|could)\b",
+    re.IGNORECASE,
+)
+
+# Maximum accepted length (characters) of a chat message
+MAX_MESSAGE_LENGTH = 4000
+
+# Upper bound on tokens generated per agent reply
+MAX_OUTPUT_TOKENS = 256
+
+# System instructions for the agent (kept short since they are sent on every turn)
+SYSTEM_PROMPT = (
+    "Answer concisely (<80 words). "
+    "Call suicide_related_tool on any self-harm or suicide mention; "
+    "student_marks_tool for student marks/grades; "
+    "positive_prompt_tool for emotional support; "
+    "negative_prompt_tool on explicit negative-prompt or avoid/exclude requests."
+)
+
+# Supportive reply used by positive_prompt_tool (bound format method, prompt is interpolated)
+POSITIVE_RESPONSE_TEMPLATE = (
+    "I hear that: '{}'. "
+    "It's completely okay to feel this way sometimes. "
+    "You matter, and things can get better step by step. "
+    "Try reaching out to someone you trust, and be kind to yourself."
+).format
+
+# Fixed safety reply returned by suicide_related_tool
+SUICIDE_SUPPORT_MESSAGE = (
+    "I'm really sorry you're feeling this way. "
+    "Your life is important and you deserve support. "
+    "Please reach out immediately to someone you trust, a family member, "
+    "friend, or local mental health professional. "
+    "If you are in immediate danger, contact your local emergency services. "
+    "You are not alone."
+)
+
+logger = logging.getLogger(__name__)
+
+# Gate on concurrent agent runs so traffic bursts stay under the OpenAI rate limits
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+# Cache of (response, tool_used) so repeated prompts skip the agent entirely
+response_cache = TTLCache(maxsize=10_000, ttl=600)
+
+# Shared async HTTP/2 client so OpenAI calls multiplex over warm keep-alive connections
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=50,
+        keepalive_expiry=60,
+    ),
+    timeout=httpx.Timeout(60.0, connect=5.0),
+)
+
+# Lifespan: connect to MongoDB on startup and release shared clients on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Raise the threadpool limit so blocking calls cannot starve sync handlers
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    mongo_client = AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=100,
+        minPoolSize=10,
+        maxIdleTimeMS=60000,
+        serverSelectionTimeoutMS=3000,
+        socketTimeoutMS=5000,
+        retryWrites=True,
+        compressors="zstd",
+    )
+    app.state.mongo = mongo_client
+
+    # Collection to store chat conversations
+    app.state.conversations = mongo_client["agent_db"]["conversations"]
+
+    # Ping once so the pool is connected before the first request arrives
+    await mongo_client.admin.command("ping")
+
+    # Compound index so history lookups are an index range scan with no sort stage
+    await app.state.conversations.create_index(HISTORY_INDEX, background=True)
+
+    # Move documents written before the short-key rename so history and reset still see them
+    await migrate_legacy_conversations(mongo_client["agent_db"])
+
+    # Build the agent now (after worker fork) and pre-warm the OpenAI connection
+    # so the first user request skips both the import cost and the TLS handshake
+    try:
+        await get_agent().llm.bind(max_tokens=1).ainvoke("ping")
+    except Exception:
+        logger.warning("OpenAI connection pre-warm failed", exc_info=True)
+
+    # Background writer that batches conversation inserts off the request path
+    app.state.write_queue = asyncio.Queue()
+    flusher = asyncio.create_task(
+        flush_conversations(app.state.write_queue, app.state.conversations)
+    )
+
+    yield
+
+    # Signal the writer to flush pending entries and wait for it to finish
+    await app.state.write_queue.put(None)
+    await flusher
+
+    mongo_client.close()
+    await http_client.aclose()
+
+# One-off migration: rename long-key conversation documents and drop their old index.
+# A marker document records completion so later startups skip it with one _id lookup.
+async def migrate_legacy_conversations(db):
+    migrations = db["migrations"]
+    if await migrations.find_one({"_id": SHORT_KEYS_MIGRATION_ID}):
+        return
+
+    conversations = db["conversations"]
+    result = await conversations.update_many(
+        {"session_id": {"$exists": True}}, SHORT_KEYS_MIGRATION
+    )
+
+    # Another worker may have dropped the index (or it never existed)
+    try:
+        await conversations.drop_index(LEGACY_HISTORY_INDEX)
+    except OperationFailure:
+        pass
+
+    await migrations.update_one(
+        {"_id": SHORT_KEYS_MIGRATION_ID},
+        {"$set": {"migrated": result.modified_count, "ts": time.time_ns()}},
+        upsert=True,
+    )
+    logger.info("Migrated %d legacy conversation documents", result.modified_count)
+
+# FastAPI application initialization
+app = FastAPI(
+    title="AI Agent Backend (Auto Tool Selection)",
+    lifespan=lifespan,
 )
 
 # Tool: Generates positive, supportive messages for emotionally low users
-@tool
 def positive_prompt_tool(prompt: str) -> str:
     """
     Tool to generate warm and uplifting responses when emotional support is needed.
     """
-    return (
-        f"I hear that: '{prompt}'. "
-        "It's completely okay to feel this way sometimes. "
-        "You matter, and things can get better step by step. "
-        "Try reaching out to someone you trust, and be kind to yourself."
-    )
+    return POSITIVE_RESPONSE_TEMPLATE(prompt)
 
 # Tool: Creates negative/exclusion-style prompts when explicitly requested
-@tool
 def negative_prompt_tool(prompt: str) -> str:
     """
     Tool to rewrite the user's prompt in a negative or exclusion-style format.
     """
     return f"Negative/exclusion-style version of your idea: Avoid {prompt}."
 
-# Tool: Provides student marks based on a simple in-memory DB lookup
-@tool
-def student_marks_tool(query: str) -> str:
-    """
-    Tool that fetches marks/grades for a student and subject from a mock database.
-    """
-    STUDENT_MARKS_DB = {
-        "Priya": {"English": 92, "Maths": 88, "Science": 95},
-        "Amit": {"English": 78, "Maths": 81, "Science": 74},
-        "Rahul": {"English": 67, "Maths": 72, "Science": 70},
-    }
-
-    q = query.replace("?", "").lower()
-
-    name = None
-    subject = None
-
-    # Detect student name from text
-    for n in STUDENT_MARKS_DB.keys():
-        if n.lower() in q:
-            name = n
-            break
+# Marks lookup shared by the marks tool; pure, so results are memoized per query
+@lru_cache(maxsize=1024)
+def lookup_student_marks(query: str) -> str:
+    # Detect student name and subject from text in one regex scan each
+    name_match = STUDENT_NAME_RE.search(query)
+    subject_match = SUBJECT_RE.search(query)
 
-    # Detect subject from text
-    for s in ["english", "maths", "science"]:
-        if s in q:
-            subject = s.capitalize()
-            break
+    name = STUDENT_NAMES[name_match.group(1).lower()] if name_match else None
+    subject = SUBJECTS[subject_match.group(1).lower()] if subject_match else None
 
     # Return guidance if name/subject not detected
     if not name or not subject:
@@ -107,162 +333,536 @@ def student_marks_tool(query: str) -> str:
     marks = STUDENT_MARKS_DB[name][subject]
 
     # Simple grade calculation
-    if marks >= 90:
-        grade = "A+"
-    elif marks >= 80:
-        grade = "A"
-    elif marks >= 70:
-        grade = "B"
-    else:
-        grade = "C"
+    grade = GRADES[bisect_right(GRADE_THRESHOLDS, marks)]
 
     return f"{name} scored {marks} in {subject} (Grade: {grade})."
 
+# Tool: Provides student marks based on a simple in-memory DB lookup
+def student_marks_tool(query: str) -> str:
+    """
+    Tool that fetches marks/grades for a student and subject from a mock database.
+    """
+    return lookup_student_marks(query)
+
 # Tool: Mandatory when detecting suicidal/self-harm intent
-@tool
 def suicide_related_tool(text: str) -> str:
     """
     Tool that provides a safe, supportive response for suicidal or self-harm related messages.
     """
-    return (
-        "I'm really sorry you're feeling this way. "
-        "Your life is important and you deserve support. "
-        "Please reach out immediately to someone you trust, a family member, "
-        "friend, or local mental health professional. "
-        "If you are in immediate danger, contact your local emergency services. "
-        "You are not alone."
-    )
+    return SUICIDE_SUPPORT_MESSAGE
 
-# List of available tools for the agent to choose from
-tools = [
+# Tool functions available to the agent (wrapped as LangChain tools in get_agent)
+tool_functions = [
     positive_prompt_tool,
     negative_prompt_tool,
     student_marks_tool,
     suicide_related_tool,
 ]
 
-# Conversation memory to store chat history in LangChain
-session_memory = ConversationBufferMemory(
-    memory_key="chat_history",
-    return_messages=True,
-)
+# Lookup of tool functions by name for direct invocation from the regex router
+tools_by_name = {f.__name__: f for f in tool_functions}
+
+# LangChain objects shared by all requests, built once by get_agent()
+class AgentComponents(NamedTuple):
+    llm: object
+    summary_llm: object
+    agent: object
+    tools: list
+
+# Build the LLMs, tools, prompt and agent on first use so importing the app stays fast
+@lru_cache(maxsize=1)
+def get_agent() -> AgentComponents:
+    from langchain_openai import ChatOpenAI
+    from langchain_core.tools import tool
+    from langchain.agents import create_openai_functions_agent
+    from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    # Create the ChatOpenAI model instance with deterministic behavior
+    llm = ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0,
+        streaming=True,
+        api_key=OPENAI_API_KEY,
+        http_async_client=http_client,
+        max_retries=0,
+        max_tokens=MAX_OUTPUT_TOKENS,
+    )
 
-# Prompt template defining system instructions and placeholders for memory
-prompt = ChatPromptTemplate.from_messages(
-    [
-        (
-            "system",
-            (
-                "You are a helpful AI assistant.\n\n"
-                "- You have access to several tools.\n"
-                "- Let the model automatically decide when to call them.\n"
-                "- Use student_marks_tool for any question about student marks/grades.\n"
-                "- Use positive_prompt_tool when the user or a friend seems emotionally low.\n"
-                "- Use negative_prompt_tool when the user explicitly asks for a negative prompt or to avoid/exclude something.\n"
-                "- For any mention of suicidal intent or self-harm, you MUST call suicide_related_tool.\n"
-            ),
-        ),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("user", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-    ]
-)
+    # Separate non-streaming model used by session memory to summarize older turns.
+    # Never cached: summaries are per-session and must not be served across sessions
+    summary_llm = ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0,
+        api_key=OPENAI_API_KEY,
+        http_async_client=http_client,
+        tags=[SUMMARY_LLM_TAG],
+        cache=False,
+    )
 
-# Create the LangChain agent that uses OpenAI function calling
-agent = create_openai_functions_agent(
-    llm=llm,
-    tools=tools,
-    prompt=prompt,
-)
+    # List of available tools for the agent to choose from
+    tools = [tool(f) for f in tool_functions]
+
+    # Prompt template defining system instructions and placeholders for memory
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", SYSTEM_PROMPT),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("user", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ]
+    )
 
-# AgentExecutor orchestrates execution, tool selection, and memory usage
-main_agent = AgentExecutor(
-    agent=agent,
-    tools=tools,
-    memory=session_memory,
-    verbose=False,
-    return_intermediate_steps=True,
-)
+    # Create the LangChain agent that uses OpenAI function calling
+    agent = create_openai_functions_agent(
+        llm=llm,
+        tools=tools,
+        prompt=prompt,
+    )
 
-# Save conversation entry to MongoDB
-def save_conversation(session_id: str, user_msg: str, ai_msg: str, tool_used: str):
-    conversation_collection.insert_one(
+    return AgentComponents(llm=llm, summary_llm=summary_llm, agent=agent, tools=tools)
+
+# Conversation memory per session, so each agent call only sees its own session's turns
+session_memories: LRUCache = LRUCache(maxsize=SESSION_MEMORY_LIMIT)
+
+# Fetch (or create) the session's memory, summarizing older turns so prompt size stays bounded
+def get_session_memory(session_id: str) -> "ConversationSummaryBufferMemory":
+    memory = session_memories.get(session_id)
+    if memory is None:
+        from langchain.memory import ConversationSummaryBufferMemory
+
+        memory = ConversationSummaryBufferMemory(
+            llm=get_agent().summary_llm,
+            max_token_limit=MEMORY_MAX_TOKENS,
+            memory_key="chat_history",
+            return_messages=True,
+        )
+        session_memories[session_id] = memory
+    return memory
+
+# Shared tokenizer for gpt-4o-mini, loaded once on first use
+@lru_cache(maxsize=1)
+def get_token_encoder():
+    return tiktoken.encoding_for_model("gpt-4o-mini")
+
+# Drop the oldest memory messages until summary + messages fit the input token limit
+def trim_memory(memory: "ConversationSummaryBufferMemory"):
+    encoder = get_token_encoder()
+    messages = memory.chat_memory.messages
+
+    # Stored text is user-controlled, so special-token strings like <|endoftext|> count as plain text
+    token_counts = [len(encoder.encode(str(m.content), disallowed_special=())) for m in messages]
+    total = len(encoder.encode(memory.moving_summary_buffer, disallowed_special=())) + sum(token_counts)
+
+    dropped = 0
+    while total > MEMORY_INPUT_TOKEN_LIMIT and dropped < len(messages):
+        total -= token_counts[dropped]
+        dropped += 1
+
+    if dropped:
+        del messages[:dropped]
+
+# AgentExecutor orchestrates execution, tool selection, and memory usage for one session
+def build_executor(memory: "ConversationSummaryBufferMemory") -> "AgentExecutor":
+    from langchain.agents import AgentExecutor
+
+    components = get_agent()
+    return AgentExecutor(
+        agent=components.agent,
+        tools=components.tools,
+        memory=memory,
+        verbose=False,
+        return_intermediate_steps=True,
+    )
+
+# Transient 429s are worth retrying; an exhausted quota (insufficient_quota) never recovers
+def is_retryable_rate_limit(exc: BaseException) -> bool:
+    from openai import RateLimitError
+
+    return isinstance(exc, RateLimitError) and getattr(exc, "code", None) != "insufficient_quota"
+
+# Retry policy for agent runs: jittered exponential backoff on retryable rate limits
+def agent_retrying(predicate=is_retryable_rate_limit) -> AsyncRetrying:
+    return AsyncRetrying(
+        retry=retry_if_exception(predicate),
+        wait=wait_exponential_jitter(initial=1, max=AGENT_RETRY_MAX_WAIT),
+        stop=stop_after_attempt(AGENT_RETRY_ATTEMPTS),
+        reraise=True,
+    )
+
+# Run the agent under the concurrency gate, retrying rate-limit errors with jittered backoff
+async def invoke_agent(memory: "ConversationSummaryBufferMemory", payload: dict) -> dict:
+    async for attempt in agent_retrying():
+        with attempt:
+            async with llm_semaphore:
+                return await build_executor(memory).ainvoke(payload)
+
+# Queue conversation entry for the background MongoDB writer
+async def save_conversation(
+    session_id: str, user_msg: str, ai_msg: str, tool_used: str, timestamp_ns: int
+):
+    app.state.write_queue.put_nowait(
         {
-            "session_id": session_id,
-            "user": user_msg,
-            "assistant": ai_msg,
-            "tool_used": tool_used,
-            "timestamp": datetime.utcnow(),
+            "sid": session_id,
+            "u": user_msg,
+            "a": ai_msg,
+            "t": tool_used,
+            "ts": timestamp_ns,
         }
     )
 
-# Retrieve chat history from the database
-def get_history(session_id: str):
-    history = (
-        conversation_collection.find({"session_id": session_id}, {"_id": 0})
-        .sort("timestamp", 1)
+# Convert a stored nanosecond epoch timestamp to an ISO-8601 UTC string (truncated to µs)
+def ns_to_iso(timestamp_ns: int) -> str:
+    # Integer split avoids float rounding of large nanosecond values
+    seconds, nanos = divmod(timestamp_ns, 1_000_000_000)
+    return (
+        datetime.fromtimestamp(seconds, tz=timezone.utc)
+        .replace(microsecond=nanos // 1000)
+        .isoformat()
     )
-    return list(history)
 
-# Pipeline: Sends user input through the agent and logs tool usage
-def run_pipeline(user_input: str, session_id: str):
+# Map a stored short-key document back to the API's history entry shape
+def expand_history_entry(doc: dict) -> dict:
+    return {
+        "user": doc["u"],
+        "assistant": doc["a"],
+        "tool_used": doc["t"],
+        "timestamp": ns_to_iso(doc["ts"]),
+    }
+
+# Retrieve one page of chat history (oldest first), optionally only entries before a timestamp.
+# Returns (entries, next_before): next_before is the raw ns cursor for the next older page, or None
+async def get_history(session_id: str, limit: int = HISTORY_PAGE_SIZE, before: int | None = None):
+    query = {"sid": session_id}
+    if before is not None:
+        query["ts"] = {"$lt": before}
+
+    # Walk the index newest-first so the limit keeps the most recent entries
+    cursor = (
+        app.state.conversations.find(query, HISTORY_PROJECTION)
+        .sort("ts", -1)
+        .hint(HISTORY_INDEX)
+        .limit(limit)
+        .batch_size(min(limit, HISTORY_BATCH_SIZE))
+    )
+    docs = await cursor.to_list(length=limit)
+
+    # A full page may have older entries; page on from the oldest stored ts returned
+    next_before = docs[-1]["ts"] if len(docs) == limit else None
+
+    # Oldest first, with full field names and ISO timestamps for the response
+    return [expand_history_entry(doc) for doc in reversed(docs)], next_before
+
+# Background task: drains queued conversation entries into MongoDB with insert_many
+async def flush_conversations(queue: asyncio.Queue, collection):
     """
-    Runs the LangChain agent on user input and logs tool usage.
+    Writes queued entries in batches of up to WRITE_BATCH_SIZE or every
+    WRITE_FLUSH_INTERVAL seconds. A None entry flushes the batch and stops the task.
     """
+    loop = asyncio.get_running_loop()
+    stopping = False
+
+    while not stopping:
+        entry = await queue.get()
+        if entry is None:
+            break
+
+        batch = [entry]
+        deadline = loop.time() + WRITE_FLUSH_INTERVAL
+
+        # Keep collecting until the batch is full or the flush interval expires
+        while len(batch) < WRITE_BATCH_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                entry = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if entry is None:
+                stopping = True
+                break
+            batch.append(entry)
+
+        try:
+            await collection.insert_many(batch, ordered=False)
+        except Exception:
+            logger.exception("Failed to write %d conversation entries", len(batch))
+
+# Regex router: picks a tool for unambiguous messages, otherwise defers to the agent
+def get_route(user_input: str) -> str:
+    # Safety first: crisis messages always go to the suicide tool
+    if SUICIDE_RE.search(user_input):
+        return "suicide_related_tool"
+
+    if NEGATIVE_RE.search(user_input):
+        return "negative_prompt_tool"
+
+    # Marks lookups need a known student, a subject and an explicit marks word, asked as a
+    # question; statements like "Amit laughed at my maths exam" go to the agent for support
+    if (
+        STUDENT_NAME_RE.search(user_input)
+        and SUBJECT_RE.search(user_input)
+        and MARKS_RE.search(user_input)
+        and QUESTION_RE.search(user_input)
+    ):
+        return "student_marks_tool"
+
+    return "no_tool"
+
+# Text handed to a routed tool: the negative tool gets only the subject, others the full message
+def get_tool_input(route: str, user_input: str) -> str:
+    if route == "negative_prompt_tool":
+        return NEGATIVE_RE.search(user_input).group("subject")
+    return user_input
+
+# Strong references to in-flight memory updates so they are not garbage collected mid-run
+memory_update_tasks: set[asyncio.Task] = set()
+
+# Record a shortcut turn in session memory; failures (tokenizer, summarizer LLM) are only logged
+async def update_memory(memory, user_input: str, response: str):
     try:
-        result = main_agent.invoke({"input": user_input})
+        await memory.asave_context({"input": user_input}, {"output": response})
+    except Exception:
+        logger.exception("Failed to update session memory")
+
+# Build the response cache key from the session, its recent memory and the user input
+def build_cache_key(session_id: str, user_input: str, memory) -> tuple:
+    recent = memory.chat_memory.messages[-CACHE_CONTEXT_MESSAGES:]
+    context = "\n".join(f"{m.type}: {m.content}" for m in recent)
+    return (
+        session_id,
+        hashlib.sha1(context.encode()).hexdigest(),
+        hashlib.sha1(user_input.encode()).hexdigest(),
+    )
 
-        # Extract final output
-        response = result.get("output", "")
+# Answer from the regex router or the response cache, or None if the agent is needed
+async def try_shortcut(user_input: str, memory, cache_key: tuple):
+    route = get_route(user_input)
 
-        # Detect last tool used if any intermediate steps exist
-        intermediate_steps = result.get("intermediate_steps", [])
-        if intermediate_steps:
-            last_action = intermediate_steps[-1][0]
-            tool_used = getattr(last_action, "tool", "unknown_tool")
-        else:
-            tool_used = "no_tool"
+    if route != "no_tool":
+        # Deterministic route: run the tool without an OpenAI round-trip
+        response = tools_by_name[route](get_tool_input(route, user_input))
+        tool_used = route
+    else:
+        cached = response_cache.get(cache_key)
+        if cached is None:
+            return None
+        response, tool_used = cached
 
-    except Exception as e:
-        response = f"Agent Error: {str(e)}"
-        tool_used = "error"
+    # Keep agent memory in step with what the user was shown, off the reply path so
+    # shortcut replies (crisis messages included) never wait on or fail with OpenAI
+    task = asyncio.create_task(update_memory(memory, user_input, response))
+    memory_update_tasks.add(task)
+    task.add_done_callback(memory_update_tasks.discard)
 
-    # Persist chat entry
-    save_conversation(session_id, user_input, response, tool_used)
+    return response, tool_used
+
+# Pipeline: Sends user input through the agent and logs tool usage
+async def run_pipeline(user_input: str, session_id: str):
+    """
+    Runs the LangChain agent on user input and returns (response, tool_used).
+    Regex-routed messages call their tool directly, and repeated prompts with
+    the same recent context are answered from the cache.
+    """
+    memory = get_session_memory(session_id)
+    cache_key = build_cache_key(session_id, user_input, memory)
+    shortcut = await try_shortcut(user_input, memory, cache_key)
+
+    if shortcut is not None:
+        response, tool_used = shortcut
+
+    else:
+        try:
+            trim_memory(memory)
+
+            result = await invoke_agent(memory, {"input": user_input})
+
+            # Extract final output
+            response = result.get("output", "")
+
+            # Detect last tool used if any intermediate steps exist
+            intermediate_steps = result.get("intermediate_steps", [])
+            if intermediate_steps:
+                last_action = intermediate_steps[-1][0]
+                tool_used = getattr(last_action, "tool", "unknown_tool")
+            else:
+                tool_used = "no_tool"
+
+            response_cache[cache_key] = (response, tool_used)
+
+        except Exception as e:
+            response = f"Agent Error: {str(e)}"
+            tool_used = "error"
 
     return response, tool_used
 
+# Format one server-sent event carrying a JSON payload
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+# Streaming pipeline: yields response tokens as server-sent events while the agent runs
+async def stream_pipeline(user_input: str, session_id: str, background_tasks: BackgroundTasks):
+    """
+    Streaming variant of run_pipeline. Emits "token" events as the model generates
+    the reply, then one "end" event with the full response and the tool used.
+    The chat entry is persisted by a background task once the stream has closed.
+    """
+    memory = get_session_memory(session_id)
+    cache_key = build_cache_key(session_id, user_input, memory)
+    shortcut = await try_shortcut(user_input, memory, cache_key)
+
+    if shortcut is not None:
+        response, tool_used = shortcut
+        yield sse_event({"type": "token", "content": response})
+
+    else:
+        tokens = []
+        tool_used = "no_tool"
+
+        try:
+            trim_memory(memory)
+
+            # Rate limits are retried only until the first token has been sent
+            retrying = agent_retrying(lambda exc: not tokens and is_retryable_rate_limit(exc))
+            async for attempt in retrying:
+                with attempt:
+                    async with llm_semaphore:
+                        events = build_executor(memory).astream_events({"input": user_input}, version="v2")
+                        async for event in events:
+                            kind = event["event"]
+
+                            # Forward final-answer tokens (function-call and summarizer chunks are skipped)
+                            if kind == "on_chat_model_stream" and SUMMARY_LLM_TAG not in event.get("tags", []):
+                                content = event["data"]["chunk"].content
+                                if content:
+                                    tokens.append(content)
+                                    yield sse_event({"type": "token", "content": content})
+
+                            # Remember the last tool the agent decided to run
+                            elif kind == "on_tool_start":
+                                tool_used = event["name"]
+
+            response = "".join(tokens)
+            response_cache[cache_key] = (response, tool_used)
+
+        except Exception as e:
+            response = f"Agent Error: {str(e)}"
+            tool_used = "error"
+            yield sse_event({"type": "token", "content": response})
+
+    timestamp_ns = time.time_ns()
+
+    yield sse_event(
+        {
+            "type": "end",
+            "timestamp": ns_to_iso(timestamp_ns),
+            "response": response,
+            "route_selected": tool_used,
+        }
+    )
+
+    # Persist chat entry after the response stream completes
+    background_tasks.add_task(
+        save_conversation, session_id, user_input, response, tool_used, timestamp_ns
+    )
+
 # Request model for chat endpoint
 class ChatRequest(BaseModel):
+    # Reject unknown fields and oversized payloads before they reach the agent
+    model_config = ConfigDict(
+        frozen=True,
+        extra="forbid",
+        str_strip_whitespace=True,
+        str_max_length=MAX_MESSAGE_LENGTH,
+    )
+
+    session_id: str = Field(min_length=1, max_length=128)
+    message: str = Field(min_length=1)
+
+# Response model for chat endpoint
+class ChatResponse(BaseModel):
+    session_id: str
+    timestamp: str
+    user: str
+    response: str
+    route_selected: str
+
+# Single stored exchange returned by the history endpoint
+class HistoryItem(BaseModel):
+    user: str
+    assistant: str
+    tool_used: str
+    timestamp: str
+
+# Response model for history endpoint
+class HistoryResponse(BaseModel):
     session_id: str
-    message: str
+    history: list[HistoryItem]
+    # Pass as `before` to fetch the next older page; None when there are no older entries
+    next_before: int | None = None
 
 # API route: Chat endpoint using agent pipeline
-@app.post("/chat")
-async def chat(req: ChatRequest):
-    response, tool_used = run_pipeline(req.message, req.session_id)
+@app.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, background_tasks: BackgroundTasks):
+    response, tool_used = await run_pipeline(req.message, req.session_id)
+    timestamp_ns = time.time_ns()
+
+    # Persist chat entry after the response has been sent
+    background_tasks.add_task(
+        save_conversation, req.session_id, req.message, response, tool_used, timestamp_ns
+    )
 
-    return {
-        "session_id": req.session_id,
-        "timestamp": datetime.utcnow().isoformat(),
-        "user": req.message,
-        "response": response,
-        "route_selected": tool_used,
-    }
+    return ChatResponse(
+        session_id=req.session_id,
+        timestamp=ns_to_iso(timestamp_ns),
+        user=req.message,
+        response=response,
+        route_selected=tool_used,
+    )
+
+# API route: Chat endpoint streaming the reply as server-sent events
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, background_tasks: BackgroundTasks):
+    return StreamingResponse(
+        stream_pipeline(req.message, req.session_id, background_tasks),
+        media_type="text/event-stream",
+    )
 
 # API route: Fetch stored conversation history
-@app.get("/history/{session_id}")
-async def fetch_history(session_id: str):
-    history = get_history(session_id)
-    return {"session_id": session_id, "history": history}
+@app.get("/history/{session_id}", response_model=HistoryResponse)
+async def fetch_history(
+    session_id: str,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_ENTRIES),
+    before: int | None = Query(None, description="Only return entries older than this epoch-nanosecond timestamp"),
+):
+    history, next_before = await get_history(session_id, limit, before)
+
+    # Returned as the response model so FastAPI serializes it straight to JSON via Pydantic
+    return HistoryResponse(session_id=session_id, history=history, next_before=next_before)
 
 # API route: Delete all conversation entries for a session
 @app.delete("/reset-history/{session_id}")
-async def reset_history(session_id: str):
-    conversation_collection.delete_many({"session_id": session_id})
+async def reset_history(session_id: str) -> dict[str, str]:
+    await app.state.conversations.delete_many({"sid": session_id})
+    session_memories.pop(session_id, None)
     return {"status": f"Session {session_id} history reset successfully"}
 
 # Root endpoint returning simple status message
 @app.get("/")
-def home():
+def home() -> dict[str, str]:
     return {"status": "AI Agent Backend (Auto Tool Selection) Running ✅"}
+
+# Production entry point: uvloop + httptools, single worker unless WEB_CONCURRENCY says otherwise
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=WEB_CONCURRENCY,
+        log_level="warning",
+        access_log=False,
+    )
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# main.py refuses to import without these; tests never reach OpenAI or MongoDB
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+# Make the top-level main module importable from the tests directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
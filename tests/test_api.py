@@ -0,0 +1,38 @@
+import warnings
+
+import pytest
+from fastapi.exceptions import FastAPIDeprecationWarning
+from fastapi.testclient import TestClient
+
+import main
+from test_history import FakeCollection
+
+
+# Client without lifespan (no MongoDB/OpenAI); history reads hit an in-memory collection
+@pytest.fixture
+def client(monkeypatch):
+    base = 1_700_000_000_000_000_000
+    docs = [
+        {"sid": "s1", "u": f"q{i}", "a": f"a{i}", "t": "no_tool", "ts": base + i}
+        for i in range(3)
+    ]
+    monkeypatch.setattr(main.app.state, "conversations", FakeCollection(docs), raising=False)
+    return TestClient(main.app)
+
+
+# History is serialized through the HistoryResponse model, cursor included
+def test_history_endpoint_returns_model_shape(client):
+    body = client.get("/history/s1", params={"limit": 2}).json()
+
+    assert body["session_id"] == "s1"
+    assert [item["user"] for item in body["history"]] == ["q1", "q2"]
+    assert set(body["history"][0]) == {"user", "assistant", "tool_used", "timestamp"}
+    assert body["next_before"] == 1_700_000_000_000_000_001
+
+
+# Responses go through FastAPI's built-in serialization without deprecation warnings
+def test_requests_emit_no_deprecation_warnings(client):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FastAPIDeprecationWarning)
+        assert client.get("/").status_code == 200
+        assert client.get("/history/s1").status_code == 200
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import main
+from main import get_history, ns_to_iso
+
+
+# Minimal stand-in for a Motor cursor over pre-sorted (newest first) documents
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def hint(self, *args):
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def batch_size(self, *args):
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+# Collection stand-in applying the sid / ts < before filter in memory
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        before = query.get("ts", {}).get("$lt")
+        docs = [
+            d for d in self.docs
+            if d["sid"] == query["sid"] and (before is None or d["ts"] < before)
+        ]
+        docs.sort(key=lambda d: d["ts"], reverse=True)
+        return FakeCursor(docs)
+
+
+# Nanosecond timestamps convert exactly, truncating to microseconds
+def test_ns_to_iso_uses_integer_arithmetic():
+    assert ns_to_iso(1_700_000_000_123_456_789) == "2023-11-14T22:13:20.123456+00:00"
+    assert ns_to_iso(1_700_000_000_999_999_999) == "2023-11-14T22:13:20.999999+00:00"
+
+
+# Paging with next_before walks back through history without repeats or gaps
+def test_history_pages_with_next_before(monkeypatch):
+    base = 1_700_000_000_000_000_000
+    docs = [
+        {"sid": "s1", "u": f"q{i}", "a": f"a{i}", "t": "no_tool", "ts": base + i}
+        for i in range(5)
+    ]
+    monkeypatch.setattr(main, "app", SimpleNamespace(state=SimpleNamespace(conversations=FakeCollection(docs))))
+
+    async def collect():
+        seen, before = [], None
+        while True:
+            page, before = await get_history("s1", limit=2, before=before)
+            seen = [entry["user"] for entry in page] + seen
+            if before is None:
+                return seen
+
+    assert asyncio.run(collect()) == ["q0", "q1", "q2", "q3", "q4"]
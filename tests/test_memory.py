@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import tiktoken
+
+import main
+from main import trim_memory
+
+
+# Byte-level encoding with one special token, so tests need no tiktoken download
+TOY_ENCODING = tiktoken.Encoding(
+    name="toy",
+    pat_str=r"\S+|\s+",
+    mergeable_ranks={bytes([b]): b for b in range(256)},
+    special_tokens={"<|endoftext|>": 256},
+)
+
+
+# Memory stand-in exposing the attributes trim_memory reads
+def make_memory(contents, summary=""):
+    messages = [SimpleNamespace(content=c) for c in contents]
+    return SimpleNamespace(
+        chat_memory=SimpleNamespace(messages=messages),
+        moving_summary_buffer=summary,
+    )
+
+
+# Special-token strings in stored turns are counted as text instead of raising
+def test_trim_memory_accepts_special_token_text(monkeypatch):
+    monkeypatch.setattr(main, "get_token_encoder", lambda: TOY_ENCODING)
+    memory = make_memory(["say <|endoftext|> please"], summary="<|endoftext|>")
+
+    trim_memory(memory)
+
+    assert len(memory.chat_memory.messages) == 1
+
+
+# Oldest turns are dropped until the memory fits the input token limit
+def test_trim_memory_drops_oldest_turns(monkeypatch):
+    monkeypatch.setattr(main, "get_token_encoder", lambda: TOY_ENCODING)
+    monkeypatch.setattr(main, "MEMORY_INPUT_TOKEN_LIMIT", 10)
+    memory = make_memory(["aaaaaaaa", "bbbbbbbb", "cccc"])
+
+    trim_memory(memory)
+
+    assert [m.content for m in memory.chat_memory.messages] == ["cccc"]
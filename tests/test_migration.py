@@ -0,0 +1,67 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo.errors import OperationFailure
+
+from main import LEGACY_HISTORY_INDEX, SHORT_KEYS_MIGRATION, SHORT_KEYS_MIGRATION_ID, migrate_legacy_conversations
+
+
+# Records the calls the migration makes against a collection
+class FakeCollection:
+    def __init__(self, marker=None, index_exists=True):
+        self.marker = marker
+        self.index_exists = index_exists
+        self.updates = []
+        self.dropped = []
+        self.upserts = []
+
+    async def find_one(self, query):
+        return self.marker
+
+    async def update_many(self, query, update):
+        self.updates.append((query, update))
+        return SimpleNamespace(modified_count=3)
+
+    async def drop_index(self, name):
+        if not self.index_exists:
+            raise OperationFailure("index not found")
+        self.dropped.append(name)
+
+    async def update_one(self, query, update, upsert=False):
+        self.upserts.append((query, upsert))
+
+
+# Database stand-in returning fixed collections by name
+def make_db(migrations, conversations):
+    return {"migrations": migrations, "conversations": conversations}
+
+
+# First startup renames legacy documents, drops the old index and records completion
+def test_migration_runs_once_and_records_marker():
+    migrations, conversations = FakeCollection(), FakeCollection()
+
+    asyncio.run(migrate_legacy_conversations(make_db(migrations, conversations)))
+
+    assert conversations.updates == [({"session_id": {"$exists": True}}, SHORT_KEYS_MIGRATION)]
+    assert conversations.dropped == [LEGACY_HISTORY_INDEX]
+    assert migrations.upserts == [({"_id": SHORT_KEYS_MIGRATION_ID}, True)]
+
+
+# A missing legacy index does not stop the migration from completing
+def test_migration_tolerates_missing_legacy_index():
+    migrations, conversations = FakeCollection(), FakeCollection(index_exists=False)
+
+    asyncio.run(migrate_legacy_conversations(make_db(migrations, conversations)))
+
+    assert migrations.upserts == [({"_id": SHORT_KEYS_MIGRATION_ID}, True)]
+
+
+# Once the marker exists, startup skips the migration entirely
+def test_migration_skipped_when_marker_exists():
+    migrations = FakeCollection(marker={"_id": SHORT_KEYS_MIGRATION_ID})
+    conversations = FakeCollection()
+
+    asyncio.run(migrate_legacy_conversations(make_db(migrations, conversations)))
+
+    assert conversations.updates == []
+    assert conversations.dropped == []
@@ -0,0 +1,109 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import BackgroundTasks
+from openai import RateLimitError
+from tenacity import wait_none
+
+import main
+from main import invoke_agent, is_retryable_rate_limit, stream_pipeline
+
+
+# Build an OpenAI 429 error with the given error code
+def rate_limit_error(code="rate_limit_exceeded"):
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return RateLimitError("rate limited", response=response, body={"code": code})
+
+
+# Executor stand-in that fails with the queued errors before succeeding
+class FakeExecutor:
+    def __init__(self, errors, tokens=("Hi", " there"), fail_after_first_token=False):
+        self.errors = list(errors)
+        self.tokens = tokens
+        self.fail_after_first_token = fail_after_first_token
+        self.calls = 0
+
+    async def ainvoke(self, payload):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"output": "".join(self.tokens), "intermediate_steps": []}
+
+    async def astream_events(self, payload, version):
+        self.calls += 1
+        if self.errors and not self.fail_after_first_token:
+            raise self.errors.pop(0)
+        for i, token in enumerate(self.tokens):
+            yield {"event": "on_chat_model_stream", "tags": [], "data": {"chunk": SimpleNamespace(content=token)}}
+            if i == 0 and self.errors:
+                raise self.errors.pop(0)
+
+
+# Skip backoff sleeps and route agent runs to the fake executor
+@pytest.fixture
+def executor(monkeypatch):
+    holder = {}
+    monkeypatch.setattr(main, "wait_exponential_jitter", lambda **kwargs: wait_none())
+    monkeypatch.setattr(main, "build_executor", lambda memory: holder["executor"])
+    monkeypatch.setattr(main, "trim_memory", lambda memory: None)
+    monkeypatch.setattr(main, "get_session_memory", lambda session_id: SimpleNamespace(chat_memory=SimpleNamespace(messages=[])))
+    main.response_cache.clear()
+    return holder
+
+
+# Consume an SSE stream and return its decoded events
+def collect_stream(message):
+    async def run():
+        return [json.loads(e[len("data: "):]) async for e in stream_pipeline(message, "s1", BackgroundTasks())]
+
+    return asyncio.run(run())
+
+
+# Quota exhaustion is a 429 too, but retrying it can never succeed
+def test_quota_errors_are_not_retryable():
+    assert is_retryable_rate_limit(rate_limit_error())
+    assert not is_retryable_rate_limit(rate_limit_error("insufficient_quota"))
+    assert not is_retryable_rate_limit(ValueError("boom"))
+
+
+# Transient rate limits are retried until the agent succeeds
+def test_invoke_agent_retries_rate_limits(executor):
+    executor["executor"] = FakeExecutor([rate_limit_error(), rate_limit_error()])
+
+    result = asyncio.run(invoke_agent(None, {"input": "hi"}))
+
+    assert result["output"] == "Hi there"
+    assert executor["executor"].calls == 3
+
+
+# Quota errors surface after a single call
+def test_invoke_agent_does_not_retry_quota_errors(executor):
+    executor["executor"] = FakeExecutor([rate_limit_error("insufficient_quota")])
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(invoke_agent(None, {"input": "hi"}))
+    assert executor["executor"].calls == 1
+
+
+# A rate limit before the first token is retried transparently
+def test_stream_retries_rate_limit_before_first_token(executor):
+    executor["executor"] = FakeExecutor([rate_limit_error()])
+
+    events = collect_stream("hello")
+
+    assert [e["content"] for e in events if e["type"] == "token"] == ["Hi", " there"]
+    assert events[-1]["response"] == "Hi there"
+    assert executor["executor"].calls == 2
+
+
+# Once tokens have been sent the stream is not replayed; the error is reported instead
+def test_stream_does_not_retry_after_first_token(executor):
+    executor["executor"] = FakeExecutor([rate_limit_error()], fail_after_first_token=True)
+
+    events = collect_stream("hello")
+
+    assert events[-1]["route_selected"] == "error"
+    assert executor["executor"].calls == 1
@@ -0,0 +1,108 @@
+import pytest
+
+from main import get_route, get_tool_input
+
+
+# Crisis wording always wins, even alongside other routed keywords
+@pytest.mark.parametrize(
+    "message",
+    [
+        "I feel suicidal",
+        "I want to end my life",
+        "thinking about self-harm",
+        "give me a negative prompt, I want to kill myself",
+    ],
+)
+def test_crisis_messages_route_to_suicide_tool(message):
+    assert get_route(message) == "suicide_related_tool"
+
+
+# Self-harm phrasing the crisis regex misses must reach the agent, not a canned tool reply
+@pytest.mark.parametrize(
+    "message",
+    [
+        "I keep trying to avoid hurting myself",
+        "I cannot avoid thinking about ending it all",
+        "I want to exclude myself from everything and disappear forever",
+    ],
+)
+def test_unmatched_self_harm_falls_through_to_agent(message):
+    assert get_route(message) == "no_tool"
+
+
+# Ordinary avoid/exclude questions are not negative-prompt requests
+@pytest.mark.parametrize(
+    "message",
+    [
+        "How can I avoid failing my exams?",
+        "Exclude weekends from my study plan",
+    ],
+)
+def test_bare_avoid_exclude_falls_through_to_agent(message):
+    assert get_route(message) == "no_tool"
+
+
+# Explicit negative-prompt requests skip the agent
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Write a negative prompt for a sunny beach photo",
+        "Please give me a negative prompt about crowded streets",
+        "Negative prompt: blurry faces",
+    ],
+)
+def test_explicit_negative_prompt_routes_to_negative_tool(message):
+    assert get_route(message) == "negative_prompt_tool"
+
+
+# Marks lookups need a student, a subject and a marks word, asked as a question
+@pytest.mark.parametrize(
+    "message, route",
+    [
+        ("What are Priya's Science marks?", "student_marks_tool"),
+        ("Show me Amit's maths grade", "student_marks_tool"),
+        ("Rahul's english score?", "student_marks_tool"),
+        ("What grade did Amit get?", "no_tool"),
+        ("How is Rahul doing today?", "no_tool"),
+        ("What are the maths marks?", "no_tool"),
+        ("I failed my maths exam and Amit laughed", "no_tool"),
+        ("Priya is sad because she got bad marks", "no_tool"),
+        ("Amit got bad maths marks and I feel awful", "no_tool"),
+    ],
+)
+def test_marks_routing(message, route):
+    assert get_route(message) == route
+
+
+# Questions about negative prompts are answered by the agent, not rewritten by the tool
+@pytest.mark.parametrize(
+    "message",
+    [
+        "What is a negative prompt?",
+        "What is a negative prompt in stable diffusion?",
+        "Can you explain what a negative prompt does?",
+        "Why is my negative prompt not working?",
+        "Write a negative prompt",
+    ],
+)
+def test_negative_prompt_questions_fall_through_to_agent(message):
+    assert get_route(message) == "no_tool"
+
+
+# The negative tool receives only the subject, not the whole sentence
+@pytest.mark.parametrize(
+    "message, subject",
+    [
+        ("Write a negative prompt for a sunny beach photo.", "a sunny beach photo"),
+        ("Negative prompt: blurry faces", "blurry faces"),
+        ("Give me a negative prompt about crowded streets!", "crowded streets"),
+    ],
+)
+def test_negative_tool_input_is_subject(message, subject):
+    assert get_tool_input("negative_prompt_tool", message) == subject
+
+
+# Other routed tools still see the full message
+def test_other_tool_input_is_full_message():
+    message = "What are Priya's Science marks?"
+    assert get_tool_input("student_marks_tool", message) == message
@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+import main
+from main import SUICIDE_SUPPORT_MESSAGE, try_shortcut
+
+
+# Session memory stand-in whose update fails like a tokenizer or summarizer outage
+class FailingMemory:
+    def __init__(self):
+        self.chat_memory = SimpleNamespace(messages=[])
+        self.calls = 0
+
+    async def asave_context(self, inputs, outputs):
+        self.calls += 1
+        raise RuntimeError("summarizer unavailable")
+
+
+# A crisis reply is returned even when the memory update fails
+def test_crisis_shortcut_survives_memory_failure():
+    async def run():
+        memory = FailingMemory()
+        result = await try_shortcut("I feel suicidal", memory, ("s", "c", "i"))
+        await asyncio.gather(*main.memory_update_tasks)
+        return result, memory.calls
+
+    result, calls = asyncio.run(run())
+
+    assert result == (SUICIDE_SUPPORT_MESSAGE, "suicide_related_tool")
+    assert calls == 1
+    assert not main.memory_update_tasks
+
+
+# Messages with no route and no cached reply are left to the agent
+def test_unrouted_uncached_message_returns_none():
+    async def run():
+        return await try_shortcut("hello there", FailingMemory(), ("s", "c", "unseen"))
+
+    assert asyncio.run(run()) is None